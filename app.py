@@ -1,50 +1,120 @@
-import json
 from datetime import datetime, UTC
 from pathlib import Path
 
 import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
 import folium
-from streamlit_folium import st_folium
+from folium.plugins import FastMarkerCluster
 
 
-DATA_FILE = Path("gw_sota_data.json")
+DATA_FILE = Path("gw_sota_data.parquet")
 last_modified = DATA_FILE.stat().st_mtime
 
+# Builds a canvas circle marker from a [lat, lon, color, popup, tooltip] row
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 8,
+        color: row[2],
+        fillColor: row[2],
+        fillOpacity: 0.8
+    });
+    marker.bindPopup(row[3]);
+    marker.bindTooltip(row[4]);
+    return marker;
+}
+"""
+
 # ----------------------
 # Data loading
 # ----------------------
 
 @st.cache_data
 def load_data(last_modified=last_modified):
-    with DATA_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    """
+    Load the pre-flattened activations written nightly by get-data.py,
+    reduced to the unique (userId, summitCode, year) activations used for
+    all aggregations, plus the same rows partitioned by year
+    """
+    df = pd.read_parquet(DATA_FILE)
+    df_unique = (
+        df
+        .drop_duplicates(subset=["userId", "summitCode", "year"])
+        .reset_index(drop=True)
+    )
+    df_by_year = {
+        year: group.reset_index(drop=True)
+        for year, group in df_unique.groupby("year", sort=False)
+    }
+
+    return df_unique, df_by_year
+
+
+@st.cache_data
+def compute_summary(last_modified, selected_year, _df_year):
+    """
+    Unique summits activated per activator in the selected year,
+    from that year's unique activations
+    """
+    return (
+        _df_year
+        .groupby(["userId", "Callsign"], observed=True, sort=False)
+        .size()
+        .astype("int16")
+        .reset_index(name="summits")
+        .sort_values("summits", ascending=False)
+    )
+
+
+@st.cache_data
+def compute_winners(last_modified, _df):
+    """
+    Top activator per year by unique summits activated,
+    from the unique activations
+    """
+    return (
+        _df
+        .groupby(["year", "userId", "Callsign"], observed=True, sort=False)
+        .size()
+        .rename("summits")
+        .reset_index()
+        .sort_values("summits", ascending=False)
+        .drop_duplicates("year", keep="first")
+        .sort_values("year", ascending=False)
+    )
 
 
-def build_activation_dataframe(data):
+@st.cache_data
+def render_map_html(last_modified, year, callsign, _df_call):
     """
-    Flatten JSON into a DataFrame with one row per activation per summit
+    Render the activation map for a callsign in a year to standalone HTML
     """
-    rows = []
-
-    for region in data["regions"].values():
-        for summit_entry in region["summits"].values():
-            summit = summit_entry["summit"]
-
-            for act in summit_entry["activations"]:
-                rows.append({
-                    "userId": act["userId"],
-                    "Callsign": act.get("Callsign"),
-                    "activationDate": act["activationDate"],
-                    "year": int(act["activationDate"][:4]),
-                    "summitCode": summit["summitCode"],
-                    "summitName": summit["name"],
-                    "points": summit["points"],
-                    "latitude": summit["latitude"],
-                    "longitude": summit["longitude"],
-                })
-
-    return pd.DataFrame(rows)
+    m = folium.Map(
+        location=[52.3, -3.7],
+        zoom_start=8,
+        tiles="OpenTopoMap",
+        prefer_canvas=True
+    )
+
+    # Each row is [lat, lon, color, popup, tooltip]; markers are drawn
+    # client-side on the canvas rather than as one DOM node each
+    marker_data = [
+        list(row) for row in zip(
+            _df_call["latitude"].tolist(),
+            _df_call["longitude"].tolist(),
+            _df_call["marker_color"].astype(str).tolist(),
+            _df_call["marker_html"].astype(str).tolist(),
+            _df_call["summitName"].astype(str).tolist(),
+        )
+    ]
+
+    FastMarkerCluster(
+        marker_data,
+        callback=MARKER_CALLBACK
+    ).add_to(m)
+
+    return m.get_root().render()
 
 # ----------------------
 # App
@@ -57,12 +127,11 @@ st.set_page_config(
 
 st.title("🏔️ GW SOTA Activator Award")
 
-data = load_data(last_modified)
-df = build_activation_dataframe(data)
-total_gw_summits = sum(region["region"]["summits"] for region in data["regions"].values())
+df_unique, df_by_year = load_data(last_modified)
+total_gw_summits = df_unique.attrs["total_gw_summits"]
 
 current_year = datetime.now(UTC).year
-available_years = sorted(df["year"].unique(), reverse=True)
+available_years = sorted(df_by_year, reverse=True)
 
 # ----------------------
 # Year selector
@@ -74,18 +143,9 @@ selected_year = st.selectbox(
     index=available_years.index(current_year) if current_year in available_years else 0
 )
 
-df_year = df[df["year"] == selected_year]
+df_year = df_by_year[selected_year]
 
-summary = (
-    df_year
-    .drop_duplicates(subset=["userId", "summitCode"])
-    .groupby(["userId", "Callsign"])
-    .agg(
-        summits=("summitCode", "count")
-    )
-    .reset_index()
-    .sort_values("summits", ascending=False)
-)
+summary = compute_summary(last_modified, selected_year, df_year)
 
 # ----------------------
 # GW summits per activator
@@ -115,7 +175,7 @@ with col_left:
 
 with col_right:
     total_summits = summary["summits"].sum()
-    total_activators = summary["Callsign"].nunique()
+    total_activators = int(summary["Callsign"].notna().sum())
 
     st.metric(
         label="Total Summits Activated",
@@ -125,7 +185,7 @@ with col_right:
 
     st.metric(
         label="Total Activators",
-        value=int(total_activators),
+        value=total_activators,
         border=True
     )
 
@@ -150,46 +210,13 @@ st.subheader("Map of activations")
 if selected_callsign:
     st.markdown(f"**Selected callsign:** `{selected_callsign}`")
 
-    df_call = (
-        df_year[df_year["Callsign"] == selected_callsign]
-        .drop_duplicates(subset=["summitCode"])
-    )
+    df_call = df_year[df_year["Callsign"] == selected_callsign]
 
     if df_call.empty:
         st.info("No activations found for that callsign in this year.")
     else:
-        m = folium.Map(
-            location=[52.3, -3.7],
-            zoom_start=8,
-            tiles="OpenTopoMap"
-        )
-
-        for _, row in df_call.iterrows():
-            popup = f"""
-            <b>{row['summitName']}</b><br>
-            <a href="https://sotl.as/summits/{row['summitCode']}" target="_blank">
-                {row['summitCode']}
-            </a><br>
-            Points: {row['points']}
-            """
-
-            folium.Marker(
-                location=[row["latitude"], row["longitude"]],
-                popup=popup,
-                tooltip=row["summitName"],
-                icon=folium.Icon(
-                    color=(
-                        "lightgreen" if row["points"] == 1 else
-                        "green" if row["points"] == 2 else
-                        "darkgreen" if row["points"] == 4 else
-                        "orange" if row["points"] == 6 else
-                        "darkred" if row["points"] == 8 else
-                        "red"
-                    )
-                )
-            ).add_to(m)
-
-        st_folium(m, width="stretch")
+        html = render_map_html(last_modified, selected_year, selected_callsign, df_call)
+        components.html(html, height=600, scrolling=False)
 else:
     st.info("Click a callsign in the table above to show their activations on the map.")
 
@@ -197,23 +224,7 @@ else:
 # Historical winners
 # ----------------------
 
-historical = (
-    df
-    .drop_duplicates(subset=["userId", "summitCode", "year"])
-    .groupby(["year", "userId", "Callsign"])
-    .agg(
-        summits=("summitCode", "count")
-    )
-    .reset_index()
-)
-
-winners = (
-    historical
-    .sort_values(["year", "summits"], ascending=[True, False])
-    .groupby("year")
-    .head(1)
-    .sort_values("year", ascending=False)
-)
+winners = compute_winners(last_modified, df_unique)
 
 col_left, col_right = st.columns(2)
 
@@ -243,11 +254,10 @@ with col_right:
     st.subheader("Total GW activations per year")
 
     yearly_totals = (
-        df
-        .drop_duplicates(subset=["userId", "summitCode", "year"])
-        .groupby("year")
-        .size()
-        .reset_index(name="Total Activations")
+        pd.DataFrame({
+            "year": list(df_by_year),
+            "Total Activations": [len(group) for group in df_by_year.values()],
+        })
         .sort_values("year")
     )
 
@@ -261,5 +271,5 @@ with col_right:
 # ----------------------
 
 st.caption(
-    f"Data generated nightly • Last update: {data['generated_at']}"
+    f"Data generated nightly • Last update: {df_unique.attrs['generated_at']}"
 )
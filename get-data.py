@@ -1,22 +1,96 @@
 import requests
-import json
+import orjson
 from datetime import datetime
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 
+import pandas as pd
+
 BASE_URL = "https://api-db2.sota.org.uk"
 API_URL = f"{BASE_URL}/api"
 ASSOCIATION_CODE = "GW"
 OUTPUT_FILE = Path("gw_sota_data.json")
+ACTIVATIONS_FILE = Path("gw_sota_data.parquet")
+ETAGS_FILE = Path("etags.json")
 
-# Be polite to the API
+# Be polite to the API: at most one request every REQUEST_DELAY seconds
+# across all worker threads
 REQUEST_DELAY = 0.2  # seconds
+MAX_WORKERS = 4
+
+# Map marker colour by summit points
+MARKER_COLORS = {
+    1: "lightgreen",
+    2: "green",
+    4: "darkgreen",
+    6: "orange",
+    8: "darkred",
+}
+
+# Shared keep-alive session, reused by every worker thread
+SESSION = requests.Session()
+
+_rate_lock = threading.Lock()
+_next_request_at = 0.0
+
+# URL -> ETag from the previous run, and the ETags seen in this run
+previous_etags = {}
+etags = {}
+
+
+def wait_for_rate_limit():
+    global _next_request_at
+
+    with _rate_lock:
+        now = time.monotonic()
+        wait = _next_request_at - now
+        _next_request_at = max(now, _next_request_at) + REQUEST_DELAY
+
+    if wait > 0:
+        time.sleep(wait)
+
+
+def get_json(url, cached=None):
+    """
+    GET url as JSON. If cached data from the previous run is given, make the
+    request conditional on its ETag and return the cached data on a 304.
+    """
+    headers = {}
+    etag = previous_etags.get(url)
+    if cached is not None and etag:
+        headers["If-None-Match"] = etag
+
+    wait_for_rate_limit()
+    response = SESSION.get(url, headers=headers, timeout=60)
 
+    if response.status_code == 304:
+        etags[url] = etag
+        return cached
 
-def get_json(url):
-    response = requests.get(url, timeout=60)
     response.raise_for_status()
-    return response.json()
+
+    if response.headers.get("ETag"):
+        etags[url] = response.headers["ETag"]
+
+    return orjson.loads(response.content)
+
+
+def load_previous_activations():
+    """
+    Returns a dict mapping summitCode -> activations from the previous output
+    """
+    if not OUTPUT_FILE.exists():
+        return {}
+
+    previous = orjson.loads(OUTPUT_FILE.read_bytes())
+
+    return {
+        summit_code: summit_entry["activations"]
+        for region in previous["regions"].values()
+        for summit_code, summit_entry in region["summits"].items()
+    }
 
 
 # ----------------------
@@ -57,12 +131,104 @@ def fetch_region_details(region_code):
     return get_json(url)
 
 
-def fetch_activations(summit_code):
+def fetch_activations(summit_code, cached=None):
     url = f"{API_URL}/activations/{summit_code}"
-    return get_json(url)
+    return get_json(url, cached)
+
+
+def fetch_summit_activations(summit_code, cached=None):
+    """
+    Fetch activations for a summit, returning an empty list on error
+    """
+    print(f"  Fetching activations for {summit_code}...")
+
+    try:
+        return fetch_activations(summit_code, cached)
+    except Exception as e:
+        print(f"    ERROR fetching {summit_code}: {e}")
+        return []
+
+
+# ----------------------
+# Flat activations table for the app
+# ----------------------
+
+def build_activation_dataframe(output):
+    """
+    Flatten output into a DataFrame with one row per activation per summit
+    """
+    rows = []
+
+    for region in output["regions"].values():
+        for summit_entry in region["summits"].values():
+            summit = summit_entry["summit"]
+
+            # Marker popup and colour only depend on the summit, so build them once here
+            marker_html = (
+                f"<b>{summit['name']}</b><br>"
+                f'<a href="https://sotl.as/summits/{summit["summitCode"]}" target="_blank">'
+                f"{summit['summitCode']}"
+                f"</a><br>"
+                f"Points: {summit['points']}"
+            )
+            marker_color = MARKER_COLORS.get(summit["points"], "red")
+
+            for act in summit_entry["activations"]:
+                rows.append({
+                    "userId": act["userId"],
+                    "Callsign": act.get("Callsign"),
+                    "activationDate": act["activationDate"],
+                    "summitCode": summit["summitCode"],
+                    "summitName": summit["name"],
+                    "points": summit["points"],
+                    "latitude": summit["latitude"],
+                    "longitude": summit["longitude"],
+                    "marker_html": marker_html,
+                    "marker_color": marker_color,
+                })
+
+    df = pd.DataFrame(rows, columns=[
+        "userId",
+        "Callsign",
+        "activationDate",
+        "summitCode",
+        "summitName",
+        "points",
+        "latitude",
+        "longitude",
+        "marker_html",
+        "marker_color",
+    ])
+
+    df["year"] = df["activationDate"].str[:4].astype("int16")
+
+    df = df.astype({
+        "Callsign": "category",
+        "summitCode": "category",
+        "summitName": "category",
+        "points": "int8",
+        "userId": "int32",
+        "latitude": "float32",
+        "longitude": "float32",
+        "marker_html": "category",
+        "marker_color": "category",
+    })
+
+    # Carried through the Parquet metadata so the app never has to open the JSON
+    df.attrs["generated_at"] = output["generated_at"]
+    df.attrs["total_gw_summits"] = sum(
+        region["region"]["summits"] for region in output["regions"].values()
+    )
+
+    return df
 
 
 def main():
+    if ETAGS_FILE.exists():
+        previous_etags.update(orjson.loads(ETAGS_FILE.read_bytes()))
+
+    previous_activations = load_previous_activations()
+
     activator_lookup = fetch_activator_roll()
 
     print("Fetching GW regions...")
@@ -74,27 +240,32 @@ def main():
         "regions": {}
     }
 
+    summits = []
+
     for region in regions:
         region_code = region["regionCode"]
         print(f"Processing region {region_code}...")
 
         region_data = fetch_region_details(region_code)
 
-        region_entry = {
+        output["regions"][region_code] = {
             "region": region_data["region"],
             "summits": {}
         }
 
         for summit in region_data["summits"]:
-            summit_code = summit["summitCode"]
-            print(f"  Fetching activations for {summit_code}...")
-
-            try:
-                activations = fetch_activations(summit_code)
-            except Exception as e:
-                print(f"    ERROR fetching {summit_code}: {e}")
-                activations = []
-
+            summits.append((region_code, summit))
+
+    print(f"Fetching activations for {len(summits)} summits...")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        summit_codes = [summit["summitCode"] for _, summit in summits]
+        all_activations = executor.map(
+            fetch_summit_activations,
+            summit_codes,
+            [previous_activations.get(summit_code) for summit_code in summit_codes]
+        )
+
+        for (region_code, summit), activations in zip(summits, all_activations):
             # Enrich activations with canonical Callsign
             enriched_activations = []
             for act in activations:
@@ -113,18 +284,23 @@ def main():
 
                 enriched_activations.append(enriched)
 
-            region_entry["summits"][summit_code] = {
+            output["regions"][region_code]["summits"][summit["summitCode"]] = {
                 "summit": summit,
                 "activations": enriched_activations
             }
 
-            time.sleep(REQUEST_DELAY)
+    print(f"Writing output to {OUTPUT_FILE}")
+    OUTPUT_FILE.write_bytes(orjson.dumps(output, option=orjson.OPT_INDENT_2))
 
-        output["regions"][region_code] = region_entry
+    print(f"Writing activations to {ACTIVATIONS_FILE}")
+    build_activation_dataframe(output).to_parquet(
+        ACTIVATIONS_FILE, index=False, compression="zstd"
+    )
 
-    print(f"Writing output to {OUTPUT_FILE}")
-    with OUTPUT_FILE.open("w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    print(f"Writing ETags to {ETAGS_FILE}")
+    ETAGS_FILE.write_bytes(
+        orjson.dumps(etags, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    )
 
     print("Done.")
 